@@ -214,7 +214,7 @@ class PointCloudManger(object):
 
     def reset_rotation(self) -> None:
         assert self.pointcloud is not None
-        self.pointcloud.rot_x, self.pointcloud.rot_y, self.pointcloud.rot_z = (0, 0, 0)
+        self.pointcloud.set_rotations(0, 0, 0)
 
     def reset_transformations(self) -> None:
         self.reset_translation()
@@ -269,9 +269,8 @@ class PointCloudManger(object):
 
         # Relabel the points if its inside the box
         if self.pointcloud.has_label:
-            assert self.pointcloud.labels is not None
-            self.pointcloud.labels[points_inside] = (
-                LabelConfig().get_class(box.classname).id
+            self.pointcloud.set_labels(
+                points_inside, LabelConfig().get_class(box.classname).id
             )
             self.pointcloud.update_selected_points_in_label_vbo(points_inside)
             logging.info(
@@ -6,6 +6,7 @@ from typing import List, Optional, Tuple, cast
 import numpy as np
 import numpy.typing as npt
 import OpenGL.GL as GL
+from OpenGL.GL.ARB.buffer_storage import glInitBufferStorageARB
 
 from labelCloud.io.labels.config import LabelConfig
 
@@ -13,12 +14,22 @@ from ..control.config_manager import config
 from ..definitions.types import LabelingMode, Point3D, Rotations3D, Translation3D
 from ..io.pointclouds import BasePointCloudHandler
 from ..io.segmentations import BaseSegmentationHandler
-from ..utils.color import colorize_points_with_height
+from ..utils import math3d
+from ..utils.color import colorize_points_with_height, colors_to_rgba8
 from ..utils.logger import end_section, green, print_column, red, start_section, yellow
+from ..utils.pc_stats import min_max_sum
 from . import Perspective
 
-# Get size of float (4 bytes) for VBOs
-SIZE_OF_FLOAT = ctypes.sizeof(ctypes.c_float)
+# Get size of unsigned byte (1 byte) for color VBOs
+SIZE_OF_UBYTE = ctypes.sizeof(ctypes.c_ubyte)
+# Interleaved layout of the point VBO (16 bytes per point)
+POINT_VBO_DTYPE = np.dtype([("position", np.float32, 3), ("color", np.uint8, 4)])
+POINT_VBO_COLOR_OFFSET = ctypes.c_void_p(POINT_VBO_DTYPE.fields["color"][1])
+
+# Only one point cloud is shown at a time, its buffers are freed on the next upload
+_uploaded_pointcloud: Optional["PointCloud"] = None
+# Above this number of separate ranges the whole label VBO is uploaded at once
+MAX_LABEL_VBO_RANGE_UPDATES = 256
 
 
 def calculate_init_translation(
@@ -55,18 +66,34 @@ class PointCloud(object):
     ) -> None:
         start_section(f"Loading {path.name}")
         self.path = path
-        self.points = points
-        self.colors = colors if type(colors) == np.ndarray and len(colors) > 0 else None
+        # VBOs and reductions expect contiguous (N, 3) float32 arrays
+        self.points = np.ascontiguousarray(points, dtype=np.float32)
+        assert self.points.ndim == 2 and self.points.shape[1] == 3
+        self._n_points = int(self.points.shape[0])
+        self.colors = (
+            np.ascontiguousarray(colors, dtype=np.float32)
+            if type(colors) == np.ndarray and len(colors) > 0
+            else None
+        )
 
         self.labels = None
+        self._label_colors_cache: Optional[npt.NDArray[np.float32]] = None
+        self._blend_buf: Optional[npt.NDArray[np.float32]] = None
         if LabelConfig().type == LabelingMode.SEMANTIC_SEGMENTATION:
             self.labels = segmentation_labels
             self.mix_ratio = config.getfloat("POINTCLOUD", "label_color_mix_ratio")
+            # lookup table from class id directly to class color
+            self.label_color_map: npt.NDArray[np.float32] = LabelConfig().color_map[
+                LabelConfig().class_order
+            ]
 
         self.vbo = None
-        self.center: Point3D = tuple(np.sum(points[:, i]) / len(points) for i in range(3))  # type: ignore
-        self.pcd_mins: npt.NDArray[np.float32] = np.amin(points, axis=0)
-        self.pcd_maxs: npt.NDArray[np.float32] = np.amax(points, axis=0)
+        self.pcd_mins: npt.NDArray[np.float32]
+        self.pcd_maxs: npt.NDArray[np.float32]
+        self.pcd_mins, self.pcd_maxs, sums = min_max_sum(self.points)
+        self.center: Point3D = tuple(sums / len(self.points))  # type: ignore
+        # center of the bounding cube, used as pivot for rotations
+        self.pcd_center: npt.NDArray[np.float32] = (self.pcd_mins + self.pcd_maxs) / 2
         self.init_translation: Point3D = init_translation or calculate_init_translation(
             self.center, self.pcd_mins, self.pcd_maxs
         )
@@ -75,6 +102,9 @@ class PointCloud(object):
         # Point cloud transformations
         self.trans_x, self.trans_y, self.trans_z = self.init_translation
         self.rot_x, self.rot_y, self.rot_z = self.init_rotation
+        # column-major transformation matrix, rebuilt after transformation changes
+        self._gl_transformation: Optional[npt.NDArray[np.float64]] = None
+        self._transform_dirty = True
 
         if self.colorless:
             # if no color in point cloud, either color with height or color with a single color
@@ -87,11 +117,10 @@ class PointCloud(object):
                 )
             else:
                 colorless_color = np.array(
-                    config.getlist("POINTCLOUD", "COLORLESS_COLOR")
-                )
-                self.colors = (np.ones_like(self.points) * colorless_color).astype(
-                    np.float32
+                    config.getlist("POINTCLOUD", "COLORLESS_COLOR"), dtype=np.float32
                 )
+                # copy, so that every point gets its own writable color
+                self.colors = np.broadcast_to(colorless_color, self.points.shape).copy()
                 logging.info(
                     "Generated colors for colorless point cloud based on `colorless_color`."
                 )
@@ -107,32 +136,138 @@ class PointCloud(object):
         return config.getfloat("POINTCLOUD", "point_size")
 
     def create_buffers(self) -> None:
-        """Create 3 different buffers holding points, colors and label colors information"""
+        """Create 2 different buffers holding interleaved points and colors as well as
+        label colors information (only if the point cloud has labels)
+
+        Colors are uploaded as 8-bit rgba values to save GPU memory and bandwidth.
+        Points and colors never change after loading, only the label colors are
+        updated later on. The buffers of the previously uploaded point cloud are
+        deleted first.
+        """
+        global _uploaded_pointcloud
+        if _uploaded_pointcloud is not None:
+            _uploaded_pointcloud.delete_buffers()
+        _uploaded_pointcloud = self
+
         self.colors = cast(npt.NDArray[np.float32], self.colors)
-        (
-            self.position_vbo,
-            self.color_vbo,
-            self.label_vbo,
-        ) = GL.glGenBuffers(3)
-        for data, vbo in [
-            (self.points, self.position_vbo),
-            (self.colors, self.color_vbo),
-            (self.label_colors, self.label_vbo),
-        ]:
+        vertices = np.empty(len(self.points), dtype=POINT_VBO_DTYPE)
+        vertices["position"] = self.points
+        vertices["color"] = colors_to_rgba8(self.colors)
+
+        self.point_vbo = GL.glGenBuffers(1)
+        buffers = [(vertices, self.point_vbo, GL.GL_STATIC_DRAW)]
+        self.label_vbo: Optional[int] = None
+        self._label_mapped: Optional[npt.NDArray[np.uint8]] = None
+        if self.has_label:
+            self.label_vbo = GL.glGenBuffers(1)
+            label_colors = colors_to_rgba8(self.label_colors)
+            if glInitBufferStorageARB():
+                self.map_label_vbo(label_colors)
+            else:
+                buffers.append((label_colors, self.label_vbo, GL.GL_DYNAMIC_DRAW))
+
+        for data, vbo, usage in buffers:
             GL.glBindBuffer(GL.GL_ARRAY_BUFFER, vbo)
-            GL.glBufferData(GL.GL_ARRAY_BUFFER, data.nbytes, data, GL.GL_DYNAMIC_DRAW)
-            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+            GL.glBufferData(GL.GL_ARRAY_BUFFER, data.nbytes, data, usage)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        self.create_vertex_arrays()
+
+    def delete_buffers(self) -> None:
+        """Delete the buffers and vertex arrays of this point cloud from the gpu"""
+        vaos = [vao for vao in (self.point_vao, self.label_vao) if vao is not None]
+        if vaos:
+            GL.glDeleteVertexArrays(len(vaos), vaos)
+        # deleting a persistently mapped buffer also unmaps it
+        vbos = [vbo for vbo in (self.point_vbo, self.label_vbo) if vbo is not None]
+        GL.glDeleteBuffers(len(vbos), vbos)
+
+        self.point_vao = self.label_vao = None
+        self.point_vbo = self.label_vbo = None
+        self._label_mapped = None
+
+    def map_label_vbo(self, label_colors: npt.NDArray[np.uint8]) -> None:
+        """Allocate the label vbo with immutable storage and keep it mapped
+
+        The persistent and coherent mapping is wrapped in `self._label_mapped`, so
+        label colors written into this array are directly visible to the gpu.
+        """
+        flags = GL.GL_MAP_WRITE_BIT | GL.GL_MAP_PERSISTENT_BIT | GL.GL_MAP_COHERENT_BIT
+        size = label_colors.nbytes
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.label_vbo)
+        GL.glBufferStorage(GL.GL_ARRAY_BUFFER, size, label_colors, flags)
+        address = GL.glMapBufferRange(GL.GL_ARRAY_BUFFER, 0, size, flags)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+
+        mapped = (ctypes.c_ubyte * size).from_address(address)
+        self._label_mapped = np.ctypeslib.as_array(mapped).reshape(label_colors.shape)
+
+    def create_vertex_arrays(self) -> None:
+        """Record the array pointers for drawing with point or label colors in VAOs
+
+        Falls back to setting the pointers on every draw if the OpenGL context
+        does not support vertex array objects (e.g. legacy contexts on macOS).
+        """
+        self.point_vao: Optional[int] = None
+        self.label_vao: Optional[int] = None
+        if not bool(GL.glGenVertexArrays):
+            logging.info("Vertex array objects are not supported, using client state.")
+            return
+
+        self.point_vao = GL.glGenVertexArrays(1)
+        GL.glBindVertexArray(self.point_vao)
+        self.set_array_pointers(color_with_label=False)
+        if self.has_label:
+            self.label_vao = GL.glGenVertexArrays(1)
+            GL.glBindVertexArray(self.label_vao)
+            self.set_array_pointers(color_with_label=True)
+        GL.glBindVertexArray(0)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+
+    def set_array_pointers(self, color_with_label: bool) -> None:
+        """Point the vertex and color arrays to the point and label buffers"""
+        # Bind interleaved point buffer
+        stride = POINT_VBO_DTYPE.itemsize
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.point_vbo)
+        GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+        GL.glVertexPointer(3, GL.GL_FLOAT, stride, None)
+
+        # Bind colors from the point buffer or from the label buffer
+        GL.glEnableClientState(GL.GL_COLOR_ARRAY)
+        if color_with_label:
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.label_vbo)
+            GL.glColorPointer(4, GL.GL_UNSIGNED_BYTE, 4 * SIZE_OF_UBYTE, None)
+        else:
+            GL.glColorPointer(4, GL.GL_UNSIGNED_BYTE, stride, POINT_VBO_COLOR_OFFSET)
 
     @property
     def label_colors(self) -> npt.NDArray[np.float32]:
+        """blended label colors, cached until the labels change"""
+        if self._label_colors_cache is None:
+            self._label_colors_cache = self._compute_label_colors()
+        return self._label_colors_cache
+
+    def _compute_label_colors(self) -> npt.NDArray[np.float32]:
         """blend the points with label color map"""
         self.colors = cast(npt.NDArray[np.float32], self.colors)
         if self.labels is not None:
-            colors = LabelConfig().color_map[LabelConfig().class_order[self.labels]]
-            return colors * self.mix_ratio + self.colors * (1 - self.mix_ratio)
+            if self._blend_buf is None:
+                self._blend_buf = np.empty_like(self.colors, dtype=np.float32)
+            # label * ratio + color * (1 - ratio), computed in place without temporaries
+            blend = self._blend_buf
+            np.take(self.label_color_map, self.labels, axis=0, out=blend)
+            blend -= self.colors
+            blend *= self.mix_ratio
+            blend += self.colors
+            return blend
         else:
             return self.colors
 
+    def set_labels(self, points_inside: npt.NDArray[np.bool_], label_id: int) -> None:
+        """Assign `label_id` to the selected points and invalidate the label colors."""
+        assert self.labels is not None
+        self.labels[points_inside] = label_id
+        self._label_colors_cache = None
+
     def save_segmentation_labels(self, extension=".bin") -> None:
         label_path = (
             config.getpath("FILE", "segmentation_folder")
@@ -195,7 +330,7 @@ class PointCloud(object):
 
     @property
     def color_with_label(self) -> bool:
-        return config.getboolean("POINTCLOUD", "color_with_label")
+        return self.has_label and config.getboolean("POINTCLOUD", "color_with_label")
 
     @property
     def has_label(self) -> bool:
@@ -210,19 +345,32 @@ class PointCloud(object):
         data sent to gpu. It leverages `glBufferSubData` method to perform
         partial update and `consecutive` method to find consecutive indexes
         so they can be updated in one single `glBufferSubData` call.
+        If the points are scattered over too many ranges, the whole label vbo
+        is updated at once instead. If the label vbo is persistently mapped,
+        the colors are written into the mapping directly.
         """
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.label_vbo)
         inside_idx = np.where(points_inside)[0]
         if inside_idx.shape[0] == 0:
             logging.warning("No points are found inside the selected boxes.")
             return
         logging.debug(f"Update {len(inside_idx)} point colors in label VBO.")
+        if self._label_mapped is not None:
+            self._label_mapped[inside_idx] = colors_to_rgba8(
+                self.label_colors[inside_idx]
+            )
+            return
+
         # find contiguous points so they can be updated together in one glBufferSubData call
         arrays = consecutive(inside_idx)
+        if len(arrays) > MAX_LABEL_VBO_RANGE_UPDATES:
+            self.update_label_vbo()
+            return
+
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.label_vbo)
         label_color = self.label_colors
-        stride = label_color.shape[1] * SIZE_OF_FLOAT
+        stride = 4 * SIZE_OF_UBYTE
         for arr in arrays:
-            colors: npt.NDArray[np.float32] = label_color[arr]
+            colors: npt.NDArray[np.uint8] = colors_to_rgba8(label_color[arr])
             # partially update label_vbo from positions arr[0] to arr[-1]
             GL.glBufferSubData(
                 GL.GL_ARRAY_BUFFER,
@@ -231,9 +379,20 @@ class PointCloud(object):
                 data=colors,
             )
 
+    def update_label_vbo(self) -> None:
+        """Send all label colors to the label vbo, reusing its existing storage."""
+        colors = colors_to_rgba8(self.label_colors)
+        if self._label_mapped is not None:
+            self._label_mapped[:] = colors
+            return
+
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.label_vbo)
+        GL.glBufferSubData(GL.GL_ARRAY_BUFFER, 0, colors.nbytes, colors)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+
     # GETTERS AND SETTERS
     def get_no_of_points(self) -> int:
-        return len(self.points)
+        return self._n_points
 
     def get_no_of_colors(self) -> int:
         return len(self.colors) if self.colors else 0
@@ -252,67 +411,84 @@ class PointCloud(object):
 
     def set_rot_x(self, angle) -> None:
         self.rot_x = angle % 360
+        self._transform_dirty = True
 
     def set_rot_y(self, angle) -> None:
         self.rot_y = angle % 360
+        self._transform_dirty = True
 
     def set_rot_z(self, angle) -> None:
         self.rot_z = angle % 360
+        self._transform_dirty = True
 
     def set_rotations(self, x: float, y: float, z: float) -> None:
         self.rot_x = x % 360
         self.rot_y = y % 360
         self.rot_z = z % 360
+        self._transform_dirty = True
 
     def set_trans_x(self, val) -> None:
         self.trans_x = val
+        self._transform_dirty = True
 
     def set_trans_y(self, val) -> None:
         self.trans_y = val
+        self._transform_dirty = True
 
     def set_trans_z(self, val) -> None:
         self.trans_z = val
+        self._transform_dirty = True
 
     def set_translations(self, x: float, y: float, z: float) -> None:
         self.trans_x = x
         self.trans_y = y
         self.trans_z = z
+        self._transform_dirty = True
 
-    def set_gl_background(self) -> None:
-        GL.glTranslate(
-            self.trans_x, self.trans_y, self.trans_z
-        )  # third, pcd translation
-
-        pcd_center = np.add(
-            self.pcd_mins, (np.subtract(self.pcd_maxs, self.pcd_mins) / 2)
+    def get_transformation_matrix(self) -> npt.NDArray[np.float64]:
+        """Get the 4x4 matrix that rotates the point cloud around its center and
+        translates it afterwards (same as the formerly used glTranslate/glRotate calls).
+        """
+        # rotate around z first, then y and x (as consecutive glRotate calls)
+        rotation = math3d.rotate_around_x(
+            math3d.rotate_around_y(
+                math3d.rotate_around_z(np.eye(3), self.rot_z, degrees=True),
+                self.rot_y,
+                degrees=True,
+            ),
+            self.rot_x,
+            degrees=True,
         )
-        GL.glTranslate(*pcd_center)  # move point cloud back
 
-        GL.glRotate(self.rot_x, 1.0, 0.0, 0.0)
-        GL.glRotate(self.rot_y, 0.0, 1.0, 0.0)  # second, pcd rotation
-        GL.glRotate(self.rot_z, 0.0, 0.0, 1.0)
+        matrix = np.eye(4)
+        matrix[:3, :3] = rotation
+        # move to center, rotate, move back and apply the pcd translation
+        matrix[:3, 3] = (
+            self.pcd_center - rotation.dot(self.pcd_center) + self.get_translation()
+        )
+        return matrix
 
-        GL.glTranslate(*(pcd_center * -1))  # move point cloud to center for rotation
+    def set_gl_background(self) -> None:
+        if self._transform_dirty:
+            # OpenGL expects the matrix in column-major order
+            self._gl_transformation = self.get_transformation_matrix().T.copy()
+            self._transform_dirty = False
+        GL.glMultMatrixd(self._gl_transformation)
         GL.glPointSize(self.point_size)
 
     def draw_pointcloud(self) -> None:
         self.set_gl_background()
-        stride = 3 * SIZE_OF_FLOAT
 
-        # Bind position buffer
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.position_vbo)
-        GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
-        GL.glVertexPointer(3, GL.GL_FLOAT, stride, None)
+        if self.point_vao is not None:
+            GL.glBindVertexArray(
+                self.label_vao if self.color_with_label else self.point_vao
+            )
+            GL.glDrawArrays(GL.GL_POINTS, 0, self._n_points)
+            GL.glBindVertexArray(0)
+            return
 
-        # Bind color buffer
-        if self.color_with_label:
-            color_vbo = self.label_vbo
-        else:
-            color_vbo = self.color_vbo
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, color_vbo)
-        GL.glEnableClientState(GL.GL_COLOR_ARRAY)
-        GL.glColorPointer(3, GL.GL_FLOAT, stride, None)
-        GL.glDrawArrays(GL.GL_POINTS, 0, self.get_no_of_points())  # Draw the points
+        self.set_array_pointers(self.color_with_label)
+        GL.glDrawArrays(GL.GL_POINTS, 0, self._n_points)  # Draw the points
 
         GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
         GL.glDisableClientState(GL.GL_COLOR_ARRAY)
@@ -320,8 +496,8 @@ class PointCloud(object):
         GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
 
     def reset_perspective(self) -> None:
-        self.trans_x, self.trans_y, self.trans_z = self.init_rotation
-        self.rot_x, self.rot_y, self.rot_z = self.init_rotation
+        self.set_translations(*self.init_translation)
+        self.set_rotations(*self.init_rotation)
 
     def print_details(self) -> None:
         print_column(
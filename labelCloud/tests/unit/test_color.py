@@ -1,6 +1,10 @@
 import numpy as np
 
-from labelCloud.utils.color import colorize_points_with_height, get_distinct_colors
+from labelCloud.utils.color import (
+    colorize_points_with_height,
+    colors_to_rgba8,
+    get_distinct_colors,
+)
 
 
 def test_get_distinct_colors() -> None:
@@ -20,3 +24,19 @@ def test_colorize_points_with_height() -> None:
     assert colors.dtype == np.float32
     assert colors.shape == (num_points, 3)
     assert 0 <= colors.max() <= 1
+
+
+def test_colorize_flat_points_with_height() -> None:
+    points = np.zeros((10, 3))
+
+    colors = colorize_points_with_height(points, 0, 0)
+    assert colors.shape == (10, 3)
+    assert (colors == colors[0]).all()
+
+
+def test_colors_to_rgba8() -> None:
+    colors = np.array([[0, 0.5, 1], [0.2, 0.4, 0.6]], dtype=np.float32)
+
+    rgba = colors_to_rgba8(colors)
+    assert rgba.dtype == np.uint8
+    np.testing.assert_array_equal(rgba, [[0, 128, 255, 255], [51, 102, 153, 255]])
@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+
+from labelCloud.utils.pc_stats import min_max_sum
+
+
+@pytest.mark.parametrize("num_points, block_size", [(1, 4), (900, 4), (900, 1000)])
+def test_min_max_sum(num_points: int, block_size: int) -> None:
+    points = np.random.uniform(low=-10, high=10, size=(num_points, 3)).astype(
+        np.float32
+    )
+
+    mins, maxs, sums = min_max_sum(points, block_size=block_size)
+    np.testing.assert_array_equal(mins, points.min(axis=0))
+    np.testing.assert_array_equal(maxs, points.max(axis=0))
+    np.testing.assert_allclose(sums, points.sum(axis=0, dtype=np.float64), rtol=1e-6)
+    assert mins.dtype == np.float32
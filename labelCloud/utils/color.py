@@ -40,10 +40,27 @@ def colorize_points_with_height(
     )
     palette_len = len(palette) - 1
 
-    colors = np.zeros(points.shape)
-    for ind, height in enumerate(points[:, 2]):
-        colors[ind] = palette[round((height - z_min) / (z_max - z_min) * palette_len)]
-    return colors.astype(np.float32)
+    # map every height to its palette index and gather all colors at once
+    z_range = z_max - z_min if z_max > z_min else 1
+    indices = np.rint((points[:, 2] - z_min) / z_range * palette_len).astype(np.intp)
+    return palette.astype(np.float32)[indices]
+
+
+def colors_to_rgba8(colors: npt.NDArray[np.float32]) -> npt.NDArray[np.uint8]:
+    """Converts rgb values between 0 and 1 to opaque 8-bit rgba values (e.g. for VBOs).
+
+    Args:
+        colors (npt.NDArray[np.float32]): n x 3 (rgb) values between 0 and 1
+    Returns:
+        npt.NDArray[np.uint8]: n x 4 (rgba) values between 0 and 255
+    """
+    scaled = np.multiply(colors, 255, dtype=np.float32)
+    np.clip(scaled, 0, 255, out=scaled)
+    np.rint(scaled, out=scaled)
+
+    rgba = np.full((len(colors), 4), 255, dtype=np.uint8)
+    rgba[:, :3] = scaled
+    return rgba
 
 
 def hex_to_rgb(hex: str) -> Color3f:
@@ -0,0 +1,38 @@
+from typing import Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+# number of points per block, small enough to keep a block in the CPU cache
+BLOCK_SIZE = 1 << 16
+
+
+def min_max_sum(
+    points: npt.NDArray[np.float32], block_size: int = BLOCK_SIZE
+) -> Tuple[npt.NDArray[np.float32], npt.NDArray[np.float32], npt.NDArray[np.float64]]:
+    """Computes the minimums, maximums and sums of a point cloud in a single pass.
+
+    The points are processed in cache-sized blocks. Each block is transposed into
+    a reused (3, block_size) buffer so that all three reductions run over
+    contiguous memory instead of strided columns.
+
+    Args:
+        points (npt.NDArray[np.float32]): n x 3 point coordinates
+        block_size (int): number of points reduced at once
+    Returns:
+        Tuple[npt.NDArray, npt.NDArray, npt.NDArray]: per-axis minimums, maximums
+        and (float64) sums
+    """
+    mins = np.full(3, np.inf, dtype=points.dtype)
+    maxs = np.full(3, -np.inf, dtype=points.dtype)
+    sums = np.zeros(3, dtype=np.float64)
+
+    buffer = np.empty((3, min(block_size, len(points))), dtype=points.dtype)
+    for start in range(0, len(points), block_size):
+        block = points[start : start + block_size]
+        columns = buffer[:, : len(block)]
+        np.copyto(columns, block.T)
+        np.minimum(mins, columns.min(axis=1), out=mins)
+        np.maximum(maxs, columns.max(axis=1), out=maxs)
+        sums += columns.sum(axis=1, dtype=np.float64)
+    return mins, maxs, sums